@@ -10,8 +10,7 @@ SECURITY MANIFEST:
 - Local files read: data/pomodoro.db, templates/*
 """
 
-import argparse
-import json
+import atexit
 import os
 import sqlite3
 import sys
@@ -23,16 +22,78 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 DB_PATH = DATA_DIR / "pomodoro.db"
+SESSION_FILE = DATA_DIR / ".current_session.json"
 
 # Ensure data directory exists
 DATA_DIR.mkdir(exist_ok=True)
 
+# Weekday abbreviations indexed by date.weekday()
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Heatmap cell per level: no sessions, started, halfway, goal achieved
+HEATMAP_LEVELS = ("⬜", "🟠", "🟡", "🟢")
+
+# Write-path and report statements, kept together for readability and reuse
+_SQL_UPSERT_TASK = """
+    INSERT INTO tasks (id, name) VALUES (?, ?)
+    ON CONFLICT (name) DO UPDATE SET name = excluded.name
+    RETURNING id
+"""
+
+_SQL_INSERT_SESSION = """
+    INSERT INTO sessions (start_time, planned_duration, task_id, date)
+    VALUES (?, ?, ?, ?)
+    RETURNING id
+"""
+
+_SQL_COMPLETE_SESSION = """
+    UPDATE sessions 
+    SET end_time = ?, actual_duration = ?, completed = 1
+    WHERE id = ?
+"""
+
+_SQL_INTERRUPT_SESSION = """
+    UPDATE sessions 
+    SET end_time = ?, actual_duration = ?, completed = 0, interruption_reason = ?
+    WHERE id = ?
+"""
+
+# Completed/interrupted totals and daily goal in a single pass
+_SQL_TODAY_AGG = """
+    SELECT
+        SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN completed = 1 THEN actual_duration ELSE 0 END),
+        SUM(CASE WHEN completed = 0 AND interruption_reason IS NOT NULL
+            THEN 1 ELSE 0 END),
+        SUM(CASE WHEN completed = 0 AND interruption_reason IS NOT NULL
+            THEN actual_duration ELSE 0 END),
+        (SELECT value FROM config WHERE key = 'daily_goal')
+    FROM sessions 
+    WHERE date = ?
+"""
+
+_SQL_EXPORT_SESSIONS = """
+    SELECT id, start_time, end_time, planned_duration, actual_duration, 
+           completed, task_id, interruption_reason, date
+    FROM sessions
+    ORDER BY start_time DESC
+"""
+
+# Shared connection, reused by every command in this process
+_conn = None
+
+# JSON serializer (orjson or stdlib), resolved on first use
+_dump_json = None
+
 
 def init_db():
     """Initialize SQLite database with required tables."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # WAL is persistent in the database file, so it only needs setting here
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
     # Sessions table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
@@ -68,6 +129,36 @@ def init_db():
         )
     """)
     
+    # Indexes for the date-filtered reports and task lookups
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_date_completed
+        ON sessions (date, completed)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_task_id
+        ON sessions (task_id) WHERE task_id IS NOT NULL
+    """)
+    
+    # Task names are unique so start can upsert by name
+    try:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_name ON tasks (name)")
+    except sqlite3.IntegrityError:
+        merge_duplicate_tasks(cursor)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_name ON tasks (name)")
+    
+    # Credit the task when a session is completed, within the same statement
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_complete
+        AFTER UPDATE OF completed ON sessions
+        WHEN NEW.completed = 1 AND OLD.completed = 0 AND NEW.task_id IS NOT NULL
+        BEGIN
+            UPDATE tasks 
+            SET completed_pomodoros = completed_pomodoros + 1,
+                total_minutes = total_minutes + COALESCE(NEW.actual_duration, 0)
+            WHERE id = NEW.task_id;
+        END
+    """)
+    
     # Set default daily goal if not exists
     cursor.execute("""
         INSERT OR IGNORE INTO config (key, value) VALUES ('daily_goal', '8')
@@ -77,14 +168,141 @@ def init_db():
     conn.close()
 
 
+def merge_duplicate_tasks(cursor):
+    """Fold tasks sharing a name into the earliest one (older databases)."""
+    # Sum the counters into the row that is kept
+    cursor.execute("""
+        UPDATE tasks
+        SET completed_pomodoros = (
+                SELECT SUM(completed_pomodoros) FROM tasks t WHERE t.name = tasks.name
+            ),
+            total_minutes = (
+                SELECT SUM(total_minutes) FROM tasks t WHERE t.name = tasks.name
+            )
+        WHERE rowid IN (SELECT MIN(rowid) FROM tasks GROUP BY name HAVING COUNT(*) > 1)
+    """)
+    
+    # Repoint sessions at the kept row, then drop the duplicates
+    cursor.execute("""
+        UPDATE sessions
+        SET task_id = (
+            SELECT k.id FROM tasks d JOIN tasks k ON k.name = d.name
+            WHERE d.id = sessions.task_id
+            ORDER BY k.rowid LIMIT 1
+        )
+        WHERE task_id IN (
+            SELECT id FROM tasks
+            WHERE rowid NOT IN (SELECT MIN(rowid) FROM tasks GROUP BY name)
+        )
+    """)
+    cursor.execute("""
+        DELETE FROM tasks
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM tasks GROUP BY name)
+    """)
+
+
 def get_db_connection():
-    """Get database connection."""
-    return sqlite3.connect(DB_PATH)
+    """Get the shared database connection, opening it on first use."""
+    global _conn
+    if _conn is None:
+        # Autocommit mode; multi-statement writes use explicit BEGIN/COMMIT
+        _conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        # Per-connection tuning; with WAL, NORMAL skips the fsync on every commit
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        _conn.execute("PRAGMA cache_size=-64000")
+        _conn.execute("PRAGMA mmap_size=268435456")
+        atexit.register(_conn.close)
+    return _conn
+
+
+def get_daily_goal():
+    """Get the configured daily goal."""
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT value FROM config WHERE key = 'daily_goal'")
+    result = cursor.fetchone()
+    return int(result[0]) if result else 8
+
+
+def load_session_file(path):
+    """Read the current session file."""
+    try:
+        import orjson as json
+    except ImportError:  # optional speedup; fall back to the stdlib json module
+        import json
+    return json.loads(path.read_bytes())
+
+
+def get_json_dumper():
+    """Get the dump_json(obj, indent=False) -> bytes serializer, chosen once."""
+    global _dump_json
+    if _dump_json is None:
+        try:
+            import orjson
+        except ImportError:  # optional speedup; fall back to the stdlib json module
+            import json
+            
+            def _dump_json(obj, indent=False):
+                if indent:
+                    return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+                return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+        else:
+            def _dump_json(obj, indent=False):
+                return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return _dump_json
+
+
+def save_session_file(path, session):
+    """Write the current session file atomically via a temp file + rename."""
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_bytes(get_json_dumper()(session))
+    os.replace(tmp_path, path)
 
 
-def generate_session_id():
-    """Generate unique session ID."""
-    return f"session_{int(time.time() * 1000)}"
+def generate_task_id():
+    """Generate unique task ID."""
+    return f"task_{os.urandom(8).hex()}"
+
+
+def start_detached_timer(session_id, duration):
+    """Fork a background process that completes the session when time is up."""
+    import signal
+    
+    # SQLite connections must not cross fork, so close the shared one first
+    # (the session is already committed); the child opens its own later
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+    
+    sys.stdout.flush()
+    if os.fork() > 0:
+        return
+    
+    # Child: leave the terminal's session and stdio, then block in the
+    # kernel until SIGALRM instead of waking every second. Whatever happens,
+    # leave via os._exit so inherited atexit handlers never run here
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        
+        signal.signal(signal.SIGALRM, lambda signum, frame: None)
+        signal.alarm(duration * 60)
+        signal.pause()
+        
+        # Only complete if this is still the active session (it may have been
+        # completed or interrupted by hand in the meantime)
+        try:
+            session = load_session_file(SESSION_FILE)
+        except (OSError, ValueError):
+            session = None  # missing or unreadable: nothing to complete
+        if isinstance(session, dict) and session.get("id") == session_id:
+            cmd_complete(None)
+            get_db_connection().close()
+    finally:
+        os._exit(0)
 
 
 def cmd_start(args):
@@ -93,73 +311,83 @@ def cmd_start(args):
     cursor = conn.cursor()
     
     now = datetime.now()
-    session_id = generate_session_id()
+    
+    # Task upsert and session insert commit together
+    cursor.execute("BEGIN IMMEDIATE")
     
     # Get task_id if task name provided
     task_id = None
     if args.task:
-        # Check if task exists, create if not
-        cursor.execute("SELECT id FROM tasks WHERE name = ?", (args.task,))
-        result = cursor.fetchone()
-        if result:
-            task_id = result[0]
-        else:
-            task_id = f"task_{int(time.time() * 1000)}"
-            cursor.execute(
-                "INSERT INTO tasks (id, name) VALUES (?, ?)",
-                (task_id, args.task)
-            )
+        # Create the task if needed and get its id in one statement
+        cursor.execute(_SQL_UPSERT_TASK, (generate_task_id(), args.task))
+        task_id = cursor.fetchone()[0]
     
-    # Insert new session
-    cursor.execute("""
-        INSERT INTO sessions (id, start_time, planned_duration, task_id, date)
-        VALUES (?, ?, ?, ?, ?)
-    """, (session_id, now.isoformat(), args.duration or 25, task_id, now.strftime("%Y-%m-%d")))
+    # Insert new session; SQLite assigns its id
+    cursor.execute(_SQL_INSERT_SESSION, (now.isoformat(), args.duration or 25, task_id, now.date().isoformat()))
+    session_id = cursor.fetchone()[0]
     
-    conn.commit()
-    conn.close()
+    cursor.execute("COMMIT")
     
     # Save current session info
-    with open(DATA_DIR / ".current_session.json", "w") as f:
-        json.dump({
-            "id": session_id,
-            "start_time": now.isoformat(),
-            "duration": args.duration or 25,
-            "task_id": task_id,
-            "task_name": args.task
-        }, f)
+    save_session_file(SESSION_FILE, {
+        "id": session_id,
+        "start_time": now.isoformat(),
+        "duration": args.duration or 25,
+        "task_id": task_id,
+        "task_name": args.task
+    })
     
     duration = args.duration or 25
     print(f"🍅 Pomodoro started! {duration} minutes.")
     print(f"⏰ Timer set for {duration} minutes.")
     print(f"🎯 Task: {args.task or 'No task specified'}")
     
-    if args.duration and args.duration > 0:
+    if args.duration and args.duration > 0 and args.detach:
+        start_detached_timer(session_id, duration)
+        print(f"\n🌙 Timer running in the background for {duration} minutes.")
+        print("💡 It completes on its own; use 'interrupt' to stop early.")
+    elif args.duration and args.duration > 0:
         # Run timer
         print(f"\n⏳ Focusing for {duration} minutes...")
-        remaining = args.duration * 60
-        while remaining > 0:
-            mins, secs = divmod(remaining, 60)
-            print(f"\r⏰ {mins:02d}:{secs:02d} remaining", end="")
-            time.sleep(1)
-            remaining -= 1
+        # Sleep against an absolute monotonic deadline so print overhead
+        # doesn't accumulate as drift; wake only when the display changes.
+        deadline = time.monotonic() + duration * 60
+        if sys.stdout.isatty():
+            # Draw the line once and park the cursor after the digits, then
+            # each tick steps back over MM:SS and rewrites only those. The
+            # field is as wide as the starting value (e.g. 120:00), and every
+            # tick is padded to it so the label is never overwritten
+            width = len(f"{duration:02d}:00")
+            sys.stdout.write(f"\r⏰ {duration:02d}:00 remaining\x1b[10D")
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                mins, secs = divmod(int(remaining) + 1, 60)
+                sys.stdout.write(f"\x1b[{width}D{f'{mins:02d}:{secs:02d}':>{width}}")
+                sys.stdout.flush()
+                time.sleep(remaining - int(remaining) or 1.0)
+        else:
+            # Nothing to redraw when piped; just sleep out the deadline
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
         
         print("\n\n🎉 Time's up! Pomodoro completed!")
-        cmd_complete(argparse.Namespace())
+        cmd_complete(None)
     else:
         print("\n💡 Use 'complete' command when done, or 'interrupt' if interrupted.")
 
 
 def cmd_complete(args):
     """Mark current session as completed."""
-    session_file = DATA_DIR / ".current_session.json"
-    
-    if not session_file.exists():
+    if not SESSION_FILE.exists():
         print("❌ No active Pomodoro session found. Start one first!")
         return
     
-    with open(session_file, "r") as f:
-        session = json.load(f)
+    session = load_session_file(SESSION_FILE)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -168,26 +396,11 @@ def cmd_complete(args):
     start_time = datetime.fromisoformat(session["start_time"])
     actual_duration = int((now - start_time).total_seconds() / 60)
     
-    cursor.execute("""
-        UPDATE sessions 
-        SET end_time = ?, actual_duration = ?, completed = 1
-        WHERE id = ?
-    """, (now.isoformat(), actual_duration, session["id"]))
-    
-    # Update task pomodoro count if task associated
-    if session.get("task_id"):
-        cursor.execute("""
-            UPDATE tasks 
-            SET completed_pomodoros = completed_pomodoros + 1,
-                total_minutes = total_minutes + ?
-            WHERE id = ?
-        """, (actual_duration, session["task_id"]))
-    
-    conn.commit()
-    conn.close()
+    # Task totals are updated by the trg_sessions_complete trigger
+    cursor.execute(_SQL_COMPLETE_SESSION, (now.isoformat(), actual_duration, session["id"]))
     
     # Remove current session file
-    session_file.unlink()
+    SESSION_FILE.unlink()
     
     print(f"✅ Pomodoro completed! Duration: {actual_duration} minutes")
     print(f"📊 Great focus session!")
@@ -195,14 +408,11 @@ def cmd_complete(args):
 
 def cmd_interrupt(args):
     """Mark current session as interrupted."""
-    session_file = DATA_DIR / ".current_session.json"
-    
-    if not session_file.exists():
+    if not SESSION_FILE.exists():
         print("❌ No active Pomodoro session found. Start one first!")
         return
     
-    with open(session_file, "r") as f:
-        session = json.load(f)
+    session = load_session_file(SESSION_FILE)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -211,17 +421,13 @@ def cmd_interrupt(args):
     start_time = datetime.fromisoformat(session["start_time"])
     actual_duration = int((now - start_time).total_seconds() / 60)
     
-    cursor.execute("""
-        UPDATE sessions 
-        SET end_time = ?, actual_duration = ?, completed = 0, interruption_reason = ?
-        WHERE id = ?
-    """, (now.isoformat(), actual_duration, args.reason or "Unknown", session["id"]))
-    
-    conn.commit()
-    conn.close()
+    cursor.execute(
+        _SQL_INTERRUPT_SESSION,
+        (now.isoformat(), actual_duration, args.reason or "Unknown", session["id"])
+    )
     
     # Remove current session file
-    session_file.unlink()
+    SESSION_FILE.unlink()
     
     print(f"⚠️ Pomodoro interrupted after {actual_duration} minutes")
     print(f"📝 Reason: {args.reason or 'Not specified'}")
@@ -233,34 +439,15 @@ def cmd_today(args):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    today = datetime.now().strftime("%Y-%m-%d")
+    today = datetime.now().date().isoformat()
     
-    # Get completed sessions
-    cursor.execute("""
-        SELECT COUNT(*), SUM(actual_duration), SUM(completed)
-        FROM sessions 
-        WHERE date = ? AND completed = 1
-    """, (today,))
+    cursor.execute(_SQL_TODAY_AGG, (today,))
     row = cursor.fetchone()
     completed_count = row[0] or 0
     total_minutes = row[1] or 0
-    
-    # Get interrupted sessions
-    cursor.execute("""
-        SELECT COUNT(*), SUM(actual_duration)
-        FROM sessions 
-        WHERE date = ? AND completed = 0 AND interruption_reason IS NOT NULL
-    """, (today,))
-    row = cursor.fetchone()
-    interrupted_count = row[0] or 0
-    interrupted_minutes = row[1] or 0
-    
-    # Get daily goal
-    cursor.execute("SELECT value FROM config WHERE key = 'daily_goal'")
-    goal_result = cursor.fetchone()
-    daily_goal = int(goal_result[0]) if goal_result else 8
-    
-    conn.close()
+    interrupted_count = row[2] or 0
+    interrupted_minutes = row[3] or 0
+    daily_goal = int(row[4]) if row[4] else 8
     
     print(f"\n📅 Today's Pomodoro Report - {today}")
     print(f"=" * 40)
@@ -297,20 +484,16 @@ def cmd_week(args):
         WHERE date >= ? AND completed = 1
         GROUP BY date
         ORDER BY date
-    """, (week_start.strftime("%Y-%m-%d"),))
+    """, (week_start.date().isoformat(),))
     
     rows = cursor.fetchall()
     
     # Get daily goal
-    cursor.execute("SELECT value FROM config WHERE key = 'daily_goal'")
-    goal_result = cursor.fetchone()
-    daily_goal = int(goal_result[0]) if goal_result else 8
-    
-    conn.close()
+    daily_goal = get_daily_goal()
     
     print(f"\n📊 Weekly Pomodoro Report")
     print(f"=" * 40)
-    print(f"📆 Week of {week_start.strftime('%Y-%m-%d')} to {today.strftime('%Y-%m-%d')}")
+    print(f"📆 Week of {week_start.date().isoformat()} to {today.date().isoformat()}")
     print()
     
     if not rows:
@@ -323,7 +506,7 @@ def cmd_week(args):
     for date, count, minutes in rows:
         total_pomodoros += count
         total_minutes += minutes or 0
-        day_name = datetime.strptime(date, "%Y-%m-%d").strftime("%a")
+        day_name = WEEKDAY_NAMES[datetime.fromisoformat(date).weekday()]
         
         # Mini bar
         progress = min(count / daily_goal, 1.0)
@@ -340,6 +523,7 @@ def cmd_week(args):
 
 def cmd_heatmap(args):
     """Generate GitHub-style heatmap for the month."""
+    import io
     import math
     
     conn = get_db_connection()
@@ -348,98 +532,88 @@ def cmd_heatmap(args):
     year = args.year or datetime.now().year
     month = args.month or datetime.now().month
     
-    # Get all sessions for the month
+    # Get all sessions for the month (range filter so the date index is used)
+    month_start = f"{year}-{month:02d}-01"
+    month_end = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+    # Month totals ride along on every row as window aggregates
     cursor.execute("""
-        SELECT date, COUNT(*), SUM(actual_duration)
+        SELECT date, COUNT(*),
+               SUM(COUNT(*)) OVER (),
+               SUM(SUM(actual_duration)) OVER (),
+               COUNT(*) OVER ()
         FROM sessions 
-        WHERE date LIKE ? AND completed = 1
+        WHERE date >= ? AND date < ? AND completed = 1
         GROUP BY date
         ORDER BY date
-    """, (f"{year}-{month:02d}%",))
+    """, (month_start, month_end))
     
     rows = cursor.fetchall()
+    if rows:
+        _, _, total_pomodoros, total_minutes, active_days = rows[0]
+        total_minutes = total_minutes or 0
+    else:
+        total_pomodoros = total_minutes = active_days = 0
     
     # Get daily goal
-    cursor.execute("SELECT value FROM config WHERE key = 'daily_goal'")
-    goal_result = cursor.fetchone()
-    daily_goal = int(goal_result[0]) if goal_result else 8
-    
-    conn.close()
+    daily_goal = get_daily_goal()
     
     # Build date map
-    date_map = {}
-    for date, count, minutes in rows:
-        date_map[date] = {"count": count, "minutes": minutes or 0}
+    date_map = {row[0]: row[1] for row in rows}
     
     # Get month info
     first_day = datetime(year, month, 1)
     last_day = (first_day + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     
-    print(f"\n🔥 Pomodoro Heatmap - {year}/{month:02d}")
-    print("=" * 50)
+    # Render the whole report into a buffer and write it once
+    buf = io.StringIO()
+    
+    print(f"\n🔥 Pomodoro Heatmap - {year}/{month:02d}", file=buf)
+    print("=" * 50, file=buf)
     
     # Print header
-    print(f"{'Mon':<5} {'Tue':<5} {'Wed':<5} {'Thu':<5} {'Fri':<5} {'Sat':<5} {'Sun':<5}")
+    print(f"{'Mon':<5} {'Tue':<5} {'Wed':<5} {'Thu':<5} {'Fri':<5} {'Sat':<5} {'Sun':<5}", file=buf)
     
     # Calculate starting position
     start_weekday = first_day.weekday()  # 0 = Monday
     
-    # Generate calendar rows
-    current = first_day
-    day_num = 1
+    # Generate calendar cells; the level index is the number of thresholds
+    # reached (started, halfway, goal), so no per-day branching is needed.
+    # Days without sessions stay at level 0 even when the goal is 0
     max_day = last_day.day
-    
-    # Create grid
-    grid = [["." for _ in range(7)] for _ in range(6)]
-    
+    counts = [
+        date_map.get(f"{year}-{month:02d}-{day_num:02d}", 0)
+        for day_num in range(1, max_day + 1)
+    ]
+    cells = ["."] * start_weekday + [
+        HEATMAP_LEVELS[(count > 0) * (1 + (count * 2 >= daily_goal) + (count >= daily_goal))]
+        for count in counts
+    ]
+    cells += ["."] * (42 - len(cells))
+    
+    # Print grid; days are contiguous, so a sixth week has content iff it
+    # starts with a day
     for week in range(6):
-        for day in range(7):
-            idx = week * 7 + day
-            
-            if idx >= start_weekday and day_num <= max_day:
-                date_str = f"{year}-{month:02d}-{day_num:02d}"
-                
-                if date_str in date_map:
-                    count = date_map[date_str]["count"]
-                    if count >= daily_goal:
-                        grid[week][day] = "🟢"  # Goal achieved
-                    elif count >= daily_goal * 0.5:
-                        grid[week][day] = "🟡"  # Halfway
-                    elif count > 0:
-                        grid[week][day] = "🟠"  # Started
-                    else:
-                        grid[week][day] = "⚪"  # No data
-                else:
-                    grid[week][day] = "⬜"  # No session
-                
-                day_num += 1
-    
-    # Print grid
-    for week in range(6):
-        row = grid[week]
-        has_content = any(c != "." for c in row)
-        if has_content or week < 5:
-            print(" ".join(row))
+        row = cells[week * 7:week * 7 + 7]
+        if week < 5 or row[0] != ".":
+            print(" ".join(row), file=buf)
     
     # Legend
-    print()
-    print("Legend:")
-    print(f"  🟢 Goal achieved ({daily_goal}+)")
-    print(f"  🟡 Halfway ({daily_goal//2}-{daily_goal-1})")
-    print(f"  🟠 Started (1-{daily_goal//2})")
-    print(f"  ⬜ No sessions")
+    print(file=buf)
+    print("Legend:", file=buf)
+    print(f"  🟢 Goal achieved ({daily_goal}+)", file=buf)
+    print(f"  🟡 Halfway ({daily_goal//2}-{daily_goal-1})", file=buf)
+    print(f"  🟠 Started (1-{daily_goal//2})", file=buf)
+    print(f"  ⬜ No sessions", file=buf)
     
     # Summary
-    total_pomodoros = sum(d["count"] for d in date_map.values())
-    total_minutes = sum(d["minutes"] for d in date_map.values())
-    active_days = len(date_map)
-    
-    print()
-    print(f"📊 Month Summary:")
-    print(f"  Total: {total_pomodoros} 🍅 ({total_minutes} min)")
-    print(f"  Active days: {active_days}/{last_day.day}")
+    print(file=buf)
+    print(f"📊 Month Summary:", file=buf)
+    print(f"  Total: {total_pomodoros} 🍅 ({total_minutes} min)", file=buf)
+    print(f"  Active days: {active_days}/{last_day.day}", file=buf)
     if active_days > 0:
-        print(f"  Daily avg: {total_minutes / active_days:.0f} min (on active days)")
+        print(f"  Daily avg: {total_minutes / active_days:.0f} min (on active days)", file=buf)
+    
+    sys.stdout.write(buf.getvalue())
 
 
 def cmd_task(args):
@@ -452,17 +626,19 @@ def cmd_task(args):
             print("❌ Please provide a task name")
             return
         
-        task_id = f"task_{int(time.time() * 1000)}"
+        task_id = generate_task_id()
         cursor.execute(
-            "INSERT INTO tasks (id, name) VALUES (?, ?)",
+            "INSERT OR IGNORE INTO tasks (id, name) VALUES (?, ?)",
             (task_id, args.name)
         )
-        conn.commit()
-        print(f"✅ Task '{args.name}' added!")
+        if cursor.rowcount:
+            print(f"✅ Task '{args.name}' added!")
+        else:
+            print(f"📝 Task '{args.name}' already exists")
     
     elif args.task_command == "list":
         cursor.execute("""
-            SELECT name, completed_pomodoros, total_minutes, created_at
+            SELECT name, completed_pomodoros, total_minutes, substr(created_at, 1, 10)
             FROM tasks
             ORDER BY created_at DESC
         """)
@@ -472,14 +648,13 @@ def cmd_task(args):
             print("📝 No tasks yet!")
             return
         
-        print("\n📋 Your Tasks:")
-        print("=" * 50)
+        # Assemble the listing and write it in one go
+        lines = ["", "📋 Your Tasks:", "=" * 50]
         for name, pomodoros, minutes, created in rows:
-            print(f"  • {name}")
-            print(f"    🍅 {pomodoros} pomodoros | ⏱ {minutes} min | 📅 {created[:10]}")
-            print()
-    
-    conn.close()
+            lines.append(f"  • {name}")
+            lines.append(f"    🍅 {pomodoros} pomodoros | ⏱ {minutes} min | 📅 {created}")
+            lines.append("")
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 def cmd_config(args):
@@ -493,14 +668,11 @@ def cmd_config(args):
                 "INSERT OR REPLACE INTO config (key, value) VALUES ('daily_goal', ?)",
                 (args.value,)
             )
-            conn.commit()
             print(f"✅ Daily goal set to {args.value} pomodoros")
         else:
             cursor.execute("SELECT value FROM config WHERE key = 'daily_goal'")
             result = cursor.fetchone()
             print(f"📊 Current daily goal: {result[0] if result else 8} pomodoros")
-    
-    conn.close()
 
 
 def cmd_export(args):
@@ -508,102 +680,92 @@ def cmd_export(args):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT id, start_time, end_time, planned_duration, actual_duration, 
-               completed, task_id, interruption_reason, date
-        FROM sessions
-        ORDER BY start_time DESC
-    """)
-    
-    rows = cursor.fetchall()
-    
-    sessions = []
-    for row in rows:
-        sessions.append({
-            "id": row[0],
-            "start_time": row[1],
-            "end_time": row[2],
-            "planned_duration": row[3],
-            "actual_duration": row[4],
-            "completed": bool(row[5]),
-            "task_id": row[6],
-            "interruption_reason": row[7],
-            "date": row[8]
-        })
+    cursor.execute(_SQL_EXPORT_SESSIONS)
+    cols = [d[0] for d in cursor.description]
     
-    conn.close()
+    # Stream rows straight from the cursor, one object at a time, so neither
+    # the row list nor the whole document is held in memory
+    out = sys.stdout.buffer
+    dump_json = get_json_dumper()
+    sessions = (dict(zip(cols, row)) for row in cursor)
     
-    if args.format == "json":
-        print(json.dumps(sessions, indent=2))
+    if args.format == "ndjson":
+        # One compact object per line
+        for session in sessions:
+            session["completed"] = bool(session["completed"])
+            out.write(dump_json(session) + b"\n")
     else:
-        print("Currently only JSON export is supported")
-
-
-def main():
+        # Indented JSON array
+        out.write(b"[")
+        sep = b"\n  "
+        for session in sessions:
+            session["completed"] = bool(session["completed"])
+            out.write(sep)
+            out.write(dump_json(session, indent=True).replace(b"\n", b"\n  "))
+            sep = b",\n  "
+        out.write(b"]\n" if sep == b"\n  " else b"\n]\n")
+
+
+# Subcommand table: name -> (help, [(flags, kwargs), ...], handler)
+COMMANDS = {
+    "start": ("Start a Pomodoro session", [
+        (("--task",), {"type": str, "help": "Task name"}),
+        (("--duration",), {"type": int, "default": 25, "help": "Duration in minutes"}),
+        (("--detach",), {"action": "store_true", "help": "Run the timer in the background"}),
+    ], cmd_start),
+    "complete": ("Complete current session", [], cmd_complete),
+    "interrupt": ("Interrupt current session", [
+        (("--reason",), {"type": str, "help": "Reason for interruption"}),
+    ], cmd_interrupt),
+    "today": ("Show today's summary", [], cmd_today),
+    "week": ("Show weekly summary", [], cmd_week),
+    "heatmap": ("Generate heatmap", [
+        (("--year",), {"type": int, "help": "Year"}),
+        (("--month",), {"type": int, "help": "Month"}),
+    ], cmd_heatmap),
+    "task": ("Manage tasks", [
+        (("task_command",), {"choices": ["add", "list"], "help": "Task command"}),
+        (("--name",), {"type": str, "help": "Task name"}),
+    ], cmd_task),
+    "config": ("Manage configuration", [
+        (("config_command",), {"choices": ["daily_goal"], "help": "Config command"}),
+        (("--value",), {"type": str, "help": "Config value"}),
+    ], cmd_config),
+    "export": ("Export data", [
+        (("--format",), {"choices": ["json", "ndjson"], "default": "json", "help": "Export format"}),
+    ], cmd_export),
+}
+
+
+def build_parser(names):
+    """Build an argument parser with subparsers for the given commands."""
+    import argparse
+    
     parser = argparse.ArgumentParser(description="🍅 Pomodoro Visualizer")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
     
-    # Start command
-    start_parser = subparsers.add_parser("start", help="Start a Pomodoro session")
-    start_parser.add_argument("--task", type=str, help="Task name")
-    start_parser.add_argument("--duration", type=int, default=25, help="Duration in minutes")
-    
-    # Complete command
-    subparsers.add_parser("complete", help="Complete current session")
-    
-    # Interrupt command
-    interrupt_parser = subparsers.add_parser("interrupt", help="Interrupt current session")
-    interrupt_parser.add_argument("--reason", type=str, help="Reason for interruption")
-    
-    # Today command
-    subparsers.add_parser("today", help="Show today's summary")
-    
-    # Week command
-    subparsers.add_parser("week", help="Show weekly summary")
-    
-    # Heatmap command
-    heatmap_parser = subparsers.add_parser("heatmap", help="Generate heatmap")
-    heatmap_parser.add_argument("--year", type=int, help="Year")
-    heatmap_parser.add_argument("--month", type=int, help="Month")
-    
-    # Task command
-    task_parser = subparsers.add_parser("task", help="Manage tasks")
-    task_parser.add_argument("task_command", choices=["add", "list"], help="Task command")
-    task_parser.add_argument("--name", type=str, help="Task name")
-    
-    # Config command
-    config_parser = subparsers.add_parser("config", help="Manage configuration")
-    config_parser.add_argument("config_command", choices=["daily_goal"], help="Config command")
-    config_parser.add_argument("--value", type=str, help="Config value")
-    
-    # Export command
-    export_parser = subparsers.add_parser("export", help="Export data")
-    export_parser.add_argument("--format", choices=["json"], default="json", help="Export format")
+    for name in names:
+        help_text, arguments, _ = COMMANDS[name]
+        sub_parser = subparsers.add_parser(name, help=help_text)
+        for flags, kwargs in arguments:
+            sub_parser.add_argument(*flags, **kwargs)
     
+    return parser
+
+
+def main():
+    # Only register the subparser that is about to run; the full parser is
+    # needed just for top-level help and unknown commands
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = build_parser([command] if command in COMMANDS else COMMANDS)
     args = parser.parse_args()
     
     # Initialize database
     init_db()
     
     # Route to command
-    if args.command == "start":
-        cmd_start(args)
-    elif args.command == "complete":
-        cmd_complete(args)
-    elif args.command == "interrupt":
-        cmd_interrupt(args)
-    elif args.command == "today":
-        cmd_today(args)
-    elif args.command == "week":
-        cmd_week(args)
-    elif args.command == "heatmap":
-        cmd_heatmap(args)
-    elif args.command == "task":
-        cmd_task(args)
-    elif args.command == "config":
-        cmd_config(args)
-    elif args.command == "export":
-        cmd_export(args)
+    if args.command in COMMANDS:
+        COMMANDS[args.command][2](args)
     else:
         parser.print_help()
         print("\n💡 Quick Examples:")